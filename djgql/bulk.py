@@ -0,0 +1,312 @@
+"""
+Batch ORM writes of one GraphQL operation.
+
+Every operation gets a `BulkWriter` in `info.context['bulk']`, writes queued by the
+mutation fields are validated and flushed in a single transaction after execution.
+Invalid items are skipped and reported on the fields which queued them:
+
+    @mutation
+    def add_reporter(parent, info, input):
+        return info.context['bulk'].create(Reporter(**input), info=info).instance
+
+Fields are serialized before the flush. A field returning an object type is completed
+again with the written instance, so generated values like `id` are returned. A field
+returning a scalar keeps what its resolver returned, it must not return values the
+flush generates, such as the pk. On databases which can't return rows from bulk inserts
+(e.g. SQLite before Django 4, MySQL), instances returned by fields are inserted one by one
+to get their pk, and `bulk_create` leaves the pk unset.
+
+List inputs are written at once inside the resolver, all or nothing. A single
+`UserInputError` carries the errors of every invalid item with its index:
+
+    @mutation
+    def import_reporters(parent, info, inputs):
+        return bulk_create(Reporter, inputs)
+"""
+import contextlib
+import operator
+import typing
+from collections import defaultdict
+from functools import reduce
+
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import Model, Q
+from django.utils.translation import ugettext_lazy as _
+from graphql import (
+    GraphQLError,
+    GraphQLResolveInfo,
+    get_nullable_type,
+    is_composite_type,
+    is_nullable_type,
+)
+
+from .exceptions import UserInputError
+
+
+def write_failed(error: DatabaseError) -> GraphQLError:
+    """
+    Hide the database message from clients, it's only shown by `original_error` under DEBUG.
+    """
+    return GraphQLError(str(_('bulk write failed')), original_error=error)
+
+
+class BulkItem:
+    """
+    One queued write, `error` is set after flush if the instance is invalid.
+    """
+
+    def __init__(self, instance: Model, info: GraphQLResolveInfo = None, index: int = None):
+        self.instance = instance
+        self.index = index
+        self.info = info
+        self.path = info.path.as_list() if info else None
+        self.nullable = is_nullable_type(info.return_type) if info else True
+        self.error: typing.Optional[UserInputError] = None
+
+    def set_error(self, messages: typing.Dict[str, typing.List[str]]) -> None:
+        kwargs = {'fields': messages}
+        if self.index is not None:
+            kwargs['index'] = self.index
+        self.error = UserInputError(_('validation error'), **kwargs)
+        self.error.path = self.path
+
+
+def set_field(data: typing.Optional[dict], path: typing.List[typing.Union[str, int]], value):
+    """
+    Return a copy of `data` with the value at `path` replaced, `data` may be shared
+    by coalesced requests. Nothing is set below an ancestor which is already null.
+    """
+    if data is None:
+        return None
+    key = path[0]
+    copied = list(data) if isinstance(data, list) else dict(data)
+    if len(path) == 1:
+        copied[key] = value
+    elif data[key] is not None:
+        copied[key] = set_field(data[key], path[1:], value)
+    return copied
+
+
+def null_field(data: typing.Optional[dict], item: BulkItem) -> typing.Optional[dict]:
+    """
+    Return a copy of `data` with the field which queued the invalid item set to null.
+
+    The field's own nullability is the only one known here, so a non-null field
+    nulls the whole `data`, as the null propagates to the root for top-level fields.
+    """
+    if data is None or not item.path:
+        return data
+    if not item.nullable:
+        return None
+    return set_field(data, item.path, None)
+
+
+def drop_errors(
+    errors: typing.List[GraphQLError], path: typing.List[typing.Union[str, int]]
+) -> typing.List[GraphQLError]:
+    """
+    Drop the errors raised at or below `path` before the field is completed again.
+    """
+    return [e for e in errors if not e.path or list(e.path[: len(path)]) != path]
+
+
+def is_completable(item: BulkItem) -> bool:
+    """
+    Whether the field which queued the written item returns an object type, such fields
+    are completed again with the written instance after flush.
+    """
+    if item.error or not item.info:
+        return False
+    return is_composite_type(get_nullable_type(item.info.return_type))
+
+
+class BulkWriter:
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size
+        self._creates: typing.Dict[typing.Type[Model], typing.List[BulkItem]] = defaultdict(list)
+        self._updates: typing.Dict[
+            typing.Tuple[typing.Type[Model], typing.Tuple[str, ...]], typing.List[BulkItem]
+        ] = defaultdict(list)
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._creates or self._updates)
+
+    def create(
+        self, instance: Model, info: GraphQLResolveInfo = None, index: int = None
+    ) -> BulkItem:
+        item = BulkItem(instance, info, index)
+        self._creates[type(instance)].append(item)
+        return item
+
+    def update(
+        self,
+        instance: Model,
+        fields: typing.Sequence[str],
+        info: GraphQLResolveInfo = None,
+        index: int = None,
+    ) -> BulkItem:
+        item = BulkItem(instance, info, index)
+        self._updates[(type(instance), tuple(fields))].append(item)
+        return item
+
+    def flush(self, all_or_nothing: bool = False) -> typing.List[BulkItem]:
+        """
+        Validate and write all queued instances in one transaction, return the flushed
+        items, invalid ones have `error` set.
+
+        Only valid instances are written, with one `bulk_create` per model and one
+        `bulk_update` per model and fields. With `all_or_nothing` nothing is written
+        if any item is invalid.
+        """
+        batches = [(model, None, items) for model, items in self._creates.items()]
+        batches += [(model, fields, items) for (model, fields), items in self._updates.items()]
+        self._creates, self._updates = defaultdict(list), defaultdict(list)
+
+        flushed, invalid = [], []
+        for model, fields, items in batches:
+            exclude = None
+            if fields is not None:
+                exclude = [f.name for f in model._meta.fields if f.name not in fields]
+            invalid += self.validate(model, items, exclude)
+            flushed += items
+        if invalid and all_or_nothing:
+            return flushed
+
+        with contextlib.ExitStack() as stack:
+            for using in sorted({router.db_for_write(model) for model, fields, items in batches}):
+                stack.enter_context(transaction.atomic(using=using))
+            for model, fields, items in batches:
+                instances = [item.instance for item in items if item.error is None]
+                if not instances:
+                    continue
+                using = router.db_for_write(model)
+                manager = model._default_manager.db_manager(using)
+                if fields is None:
+                    if not connections[using].features.can_return_rows_from_bulk_insert:
+                        # Fields returning the instance need its pk, which only a
+                        # single INSERT returns on this database.
+                        for item in items:
+                            if item.error is None and is_completable(item):
+                                item.instance.save(using=using, force_insert=True)
+                                instances.remove(item.instance)
+                    manager.bulk_create(instances, batch_size=self.batch_size)
+                else:
+                    manager.bulk_update(instances, fields, batch_size=self.batch_size)
+        return flushed
+
+    def validate(
+        self, model: typing.Type[Model], items: typing.List[BulkItem], exclude=None
+    ) -> typing.List[BulkItem]:
+        messages: typing.Dict[BulkItem, typing.Dict[str, typing.List[str]]] = {}
+        for item in items:
+            try:
+                item.instance.full_clean(exclude=exclude, validate_unique=False)
+            except ValidationError as e:
+                messages[item] = e.message_dict
+
+        clean = [item for item in items if item not in messages]
+        for item, error in self.check_unique(model, clean, exclude):
+            for field, errors in error.message_dict.items():
+                messages.setdefault(item, {}).setdefault(field, []).extend(errors)
+
+        invalid = [item for item in items if item in messages]
+        for item in invalid:
+            item.set_error(messages[item])
+        return invalid
+
+    def check_unique(
+        self, model: typing.Type[Model], items: typing.List[BulkItem], exclude=None
+    ) -> typing.Iterator[typing.Tuple[BulkItem, ValidationError]]:
+        """
+        Check unique constraints of the whole batch with one query per constraint and chunk,
+        including duplicates within the batch.
+        """
+        if not items:
+            return
+        unique_checks, date_checks = items[0].instance._get_unique_checks(exclude=exclude)
+        using = router.db_for_write(model)
+        for model_class, unique_check in unique_checks:
+            attnames = [model_class._meta.get_field(name).attname for name in unique_check]
+            groups: typing.Dict[tuple, typing.List[BulkItem]] = defaultdict(list)
+            for item in items:
+                values = tuple(getattr(item.instance, attname) for attname in attnames)
+                # Like Model._perform_unique_checks, NULL values never conflict.
+                if None not in values:
+                    groups[values].append(item)
+            if not groups:
+                continue
+
+            existing = self.get_existing(model_class, using, attnames, list(groups))
+            key = unique_check[0] if len(unique_check) == 1 else NON_FIELD_ERRORS
+            for values, group in groups.items():
+                for position, item in enumerate(group):
+                    instance = item.instance
+                    taken = values in existing and (
+                        instance._state.adding or existing[values] != instance.pk
+                    )
+                    if position > 0 or taken:
+                        message = instance.unique_error_message(model_class, unique_check)
+                        yield item, ValidationError({key: [message]})
+
+    def get_existing(
+        self,
+        model: typing.Type[Model],
+        using: str,
+        attnames: typing.List[str],
+        values: typing.List[tuple],
+    ) -> typing.Dict[tuple, typing.Any]:
+        """
+        Return the pks of existing rows by unique values, queried in chunks so that
+        large batches stay within the database's parameter and expression limits.
+        """
+        manager = model._default_manager.db_manager(using)
+        batch_size = connections[using].ops.bulk_batch_size(attnames, values)
+        if self.batch_size:
+            batch_size = min(batch_size, self.batch_size)
+        batch_size = max(batch_size, 1)
+        existing = {}
+        for start in range(0, len(values), batch_size):
+            end = start + batch_size
+            chunk = values[start:end]
+            if len(attnames) == 1:
+                lookup = Q(**{'%s__in' % attnames[0]: [value for value, in chunk]})
+            else:
+                lookup = reduce(operator.or_, (Q(**dict(zip(attnames, v))) for v in chunk))
+            rows = manager.filter(lookup).values_list('pk', *attnames)
+            existing.update((tuple(row_values), pk) for pk, *row_values in rows)
+        return existing
+
+
+def _write(writer: BulkWriter, items: typing.List[BulkItem]) -> typing.List[Model]:
+    try:
+        flushed = writer.flush(all_or_nothing=True)
+    except DatabaseError as e:
+        raise write_failed(e) from e
+    errors = [item.error.extensions['exception'] for item in flushed if item.error]
+    if errors:
+        raise UserInputError(_('validation error'), errors=errors)
+    return [item.instance for item in items]
+
+
+def bulk_create(
+    model: typing.Type[Model], inputs: typing.Iterable[dict], batch_size: int = None
+) -> typing.List[Model]:
+    """
+    Create instances of the list input with one `bulk_create`, nothing is written
+    if any item is invalid.
+    """
+    writer = BulkWriter(batch_size)
+    items = [writer.create(model(**data), index=index) for index, data in enumerate(inputs)]
+    return _write(writer, items)
+
+
+def bulk_update(
+    instances: typing.Iterable[Model], fields: typing.Sequence[str], batch_size: int = None
+) -> typing.List[Model]:
+    writer = BulkWriter(batch_size)
+    items = [
+        writer.update(instance, fields, index=index) for index, instance in enumerate(instances)
+    ]
+    return _write(writer, items)
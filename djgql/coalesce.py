@@ -0,0 +1,69 @@
+"""
+Single-flight coalescing of identical concurrent operations.
+
+    path('graphql/', AsyncGraphQLView.as_view(schema=schema, coalescer=Coalescer()))
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import threading
+import typing
+import weakref
+
+from graphql import ExecutionResult
+
+
+class Coalescer:
+    """
+    Share one execution between identical in-flight `query` operations.
+
+    `operations` is an allow-list of operation names, `None` allows all queries.
+    """
+
+    def __init__(self, operations: typing.Sequence[str] = None):
+        self.operations = None if operations is None else set(operations)
+        self.executions = 0
+        self.saved = 0
+        # In-flight executions per event loop, a task can only be awaited on its own loop.
+        self._in_flight: typing.MutableMapping[
+            asyncio.AbstractEventLoop, typing.Dict[str, asyncio.Future]
+        ] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def allow(self, operation_type: typing.Optional[str], operation_name: str = None) -> bool:
+        if operation_type != 'query':
+            return False
+        return self.operations is None or operation_name in self.operations
+
+    @staticmethod
+    def make_key(query: str, variables: dict, operation_name: str, scope: str) -> str:
+        document = hashlib.sha256(query.encode()).hexdigest()
+        variables = json.dumps(variables or {}, sort_keys=True, default=str)
+        return json.dumps([document, variables, operation_name, scope])
+
+    async def run(
+        self, key: str, execute: typing.Callable[[], typing.Awaitable[ExecutionResult]]
+    ) -> ExecutionResult:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            in_flight = self._in_flight.setdefault(loop, {})
+            task = in_flight.get(key)
+            if task is None:
+                self.executions += 1
+                task = loop.create_task(execute())
+                in_flight[key] = task
+                task.add_done_callback(functools.partial(self._done, in_flight, key))
+            else:
+                self.saved += 1
+        # Shield the shared execution so that a disconnected client doesn't cancel the others.
+        return await asyncio.shield(task)
+
+    def _done(self, in_flight: typing.Dict[str, asyncio.Future], key: str, task) -> None:
+        with self._lock:
+            if in_flight.get(key) is task:
+                del in_flight[key]
+
+    @property
+    def stats(self) -> typing.Dict[str, int]:
+        return {'executions': self.executions, 'saved': self.saved}
@@ -0,0 +1,163 @@
+"""
+Route database access by GraphQL operation type.
+
+`GraphQLView` records the operation type of every request before execution,
+`OperationRouter` then sends `query` operations to the read replicas and
+everything else to the primary database.
+
+    # settings.py
+    DATABASE_ROUTERS = ['djgql.routing.OperationRouter']
+    GRAPHQL_REPLICAS = ['replica1', 'replica2']
+    GRAPHQL_REPLICA_STRATEGY = 'round_robin'  # or 'least_lag'
+    GRAPHQL_STICKY_SECONDS = 3
+
+`least_lag` runs `GRAPHQL_REPLICA_LAG_QUERY` on every replica, it must return the lag
+in seconds and is cached for `GRAPHQL_REPLICA_LAG_CACHE_SECONDS`. Replicas whose query
+fails are skipped until the cache expires, the primary is used when all of them fail.
+Without the query the router falls back to `round_robin`.
+
+    # PostgreSQL
+    GRAPHQL_REPLICA_LAG_QUERY = (
+        'SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())'
+    )
+"""
+import itertools
+import logging
+import math
+import time
+import typing
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from graphql import DocumentNode, OperationType, get_operation_ast
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_ALIAS = 'default'
+STICKY_COOKIE_NAME = 'djgql_pinned'
+
+_operation_type: ContextVar[typing.Optional[str]] = ContextVar('operation_type', default=None)
+_pinned: ContextVar[bool] = ContextVar('pinned', default=False)
+
+
+def get_operation_type(
+    document: DocumentNode, operation_name: typing.Optional[str] = None
+) -> typing.Optional[str]:
+    """
+    Return the type (`query`, `mutation` or `subscription`) of the operation
+    which will be executed, or `None` if it can't be determined.
+    """
+    operation = get_operation_ast(document, operation_name)
+    if not operation:
+        return None
+    return operation.operation.value
+
+
+def set_operation_type(operation_type: typing.Optional[str], pinned: bool = False):
+    """
+    Set the routing hint of current request, return tokens for `reset_operation_type`.
+    """
+    return _operation_type.set(operation_type), _pinned.set(pinned)
+
+
+def reset_operation_type(tokens) -> None:
+    operation_token, pinned_token = tokens
+    _operation_type.reset(operation_token)
+    _pinned.reset(pinned_token)
+
+
+def current_operation_type() -> typing.Optional[str]:
+    return _operation_type.get()
+
+
+def get_sticky_seconds() -> int:
+    return getattr(settings, 'GRAPHQL_STICKY_SECONDS', 0)
+
+
+def is_pinned(request: HttpRequest) -> bool:
+    """
+    Whether the request was sent within the sticky window after a mutation.
+    """
+    return get_sticky_seconds() > 0 and STICKY_COOKIE_NAME in request.COOKIES
+
+
+def pin_response(response: HttpResponse, operation_type: typing.Optional[str]) -> HttpResponse:
+    """
+    Pin following requests of the client to the primary database after a mutation,
+    so that it can read its own writes.
+    """
+    seconds = get_sticky_seconds()
+    if seconds > 0 and operation_type == OperationType.MUTATION.value:
+        response.set_cookie(STICKY_COOKIE_NAME, '1', max_age=seconds, httponly=True)
+    return response
+
+
+class OperationRouter:
+    """
+    Send `query` operations to `GRAPHQL_REPLICAS`, and all the others to the primary.
+    """
+
+    def __init__(self) -> None:
+        self.primary = getattr(settings, 'GRAPHQL_PRIMARY', DEFAULT_DB_ALIAS)
+        self.replicas = list(getattr(settings, 'GRAPHQL_REPLICAS', []))
+        self.strategy = getattr(settings, 'GRAPHQL_REPLICA_STRATEGY', 'round_robin')
+        self.lag_query = getattr(settings, 'GRAPHQL_REPLICA_LAG_QUERY', None)
+        self.lag_cache_seconds = getattr(settings, 'GRAPHQL_REPLICA_LAG_CACHE_SECONDS', 5)
+        self._cycle = itertools.cycle(self.replicas)
+        self._lags: typing.Dict[str, typing.Tuple[float, float]] = {}
+
+    def get_replica_lag(self, alias: str) -> float:
+        """
+        Return the replication lag of the replica in seconds, used by `least_lag` strategy.
+
+        A replica whose lag can't be queried is cached with infinite lag, so it isn't
+        queried again or read from until the cache expires.
+        """
+        now = time.monotonic()
+        cached = self._lags.get(alias)
+        if cached and cached[0] > now:
+            return cached[1]
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(self.lag_query)
+                row = cursor.fetchone()
+        except Exception:
+            logger.warning('Failed to get lag of replica %s.', alias, exc_info=True)
+            lag = math.inf
+        else:
+            # Replication lag is NULL when nothing has been replayed yet.
+            lag = float(row[0]) if row and row[0] is not None else 0.0
+        self._lags[alias] = (now + self.lag_cache_seconds, lag)
+        return lag
+
+    def get_replica(self) -> str:
+        if self.strategy == 'least_lag' and self.lag_query:
+            lags = {alias: self.get_replica_lag(alias) for alias in self.replicas}
+            available = [alias for alias in self.replicas if lags[alias] != math.inf]
+            if not available:
+                return self.primary
+            return min(available, key=lags.__getitem__)
+        return next(self._cycle)
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or _pinned.get():
+            return self.primary
+        if _operation_type.get() != OperationType.QUERY.value:
+            return self.primary
+        return self.get_replica()
+
+    def db_for_write(self, model, **hints):
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {self.primary, *self.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in self.replicas:
+            return False
+        return None
@@ -1,9 +1,12 @@
 import asyncio
+import inspect
 import json
 import traceback
 import typing
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import DatabaseError
 from django.http import HttpRequest, HttpResponse
 from django.utils.decorators import classonlymethod, method_decorator
 from django.utils.translation import ugettext_lazy as _
@@ -11,8 +14,19 @@ from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from gql.playground import PLAYGROUND_HTML
 from gql.utils import place_files_in_operations
-from graphql import ExecutionResult, GraphQLError, GraphQLSchema, graphql, graphql_sync
-
+from graphql import (
+    DocumentNode,
+    ExecutionContext,
+    ExecutionResult,
+    GraphQLError,
+    GraphQLSchema,
+    execute,
+    parse,
+    validate,
+)
+
+from . import bulk, routing
+from .coalesce import Coalescer
 from .exceptions import GraphQLExtensionError, MethodNotAllowedError, UserInputError
 from .response import Response
 
@@ -71,7 +85,7 @@ class GraphQLView(View):
         if execution_result.errors:
             data['errors'] = [self.format_error(e) for e in execution_result.errors]
         data['data'] = execution_result.data
-        return Response(data)
+        return routing.pin_response(Response(data), getattr(request, 'operation_type', None))
 
     def parse_body(self, request: HttpRequest) -> dict:
         content_type = self.get_content_type(request)
@@ -109,15 +123,122 @@ class GraphQLView(View):
     def execute_graphql_request(self, request, query, variables, operation_name) -> ExecutionResult:
         if not query:
             raise UserInputError(_('Must provide query string.'))
-        context = self.context_value or {}
+        document, errors = self.parse_document(query)
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+        context = self.get_context(request)
+        tokens = self.set_routing_hint(request, document, operation_name)
+        try:
+            result = execute(
+                self.schema,
+                document,
+                variable_values=variables,
+                context_value=context,
+                operation_name=operation_name,
+            )
+            if inspect.isawaitable(result):
+                if inspect.iscoroutine(result):
+                    result.close()
+                raise RuntimeError('GraphQL execution failed to complete synchronously.')
+            if not context['bulk'].pending:
+                return result
+            try:
+                items = context['bulk'].flush()
+            except DatabaseError as e:
+                return self.bulk_failed(result, e)
+            result = self.merge_bulk_errors(result, items)
+            execution_context, items = self.get_bulk_completion(
+                result, items, context, document, variables, operation_name
+            )
+            data, errors = result.data, list(result.errors or [])
+            for item in items:
+                info = item.info
+                errors = bulk.drop_errors(errors, item.path)
+                try:
+                    value = execution_context.complete_value(
+                        info.return_type, info.field_nodes, info, info.path, item.instance
+                    )
+                    if inspect.isawaitable(value):
+                        if inspect.iscoroutine(value):
+                            value.close()
+                        raise RuntimeError('GraphQL execution failed to complete synchronously.')
+                except GraphQLError as error:
+                    errors.append(error)
+                    data = bulk.null_field(data, item)
+                else:
+                    data = bulk.set_field(data, item.path, value)
+            if not items:
+                return result
+            return ExecutionResult(data=data, errors=(errors + execution_context.errors) or None)
+        finally:
+            routing.reset_operation_type(tokens)
+
+    def get_context(self, request) -> dict:
+        context = dict(self.context_value or {})
         context['request'] = request
-        return graphql_sync(
+        context['bulk'] = bulk.BulkWriter()
+        return context
+
+    @staticmethod
+    def bulk_failed(result: ExecutionResult, error: DatabaseError) -> ExecutionResult:
+        errors = list(result.errors or [])
+        errors.append(bulk.write_failed(error))
+        return ExecutionResult(data=None, errors=errors)
+
+    @staticmethod
+    def merge_bulk_errors(result: ExecutionResult, items: typing.List[bulk.BulkItem]):
+        """
+        Report invalid queued writes on the fields which queued them.
+
+        `result` may be shared by coalesced requests, so a new result is returned.
+        """
+        invalid = [item for item in items if item.error]
+        if not invalid:
+            return result
+        data = result.data
+        errors = list(result.errors or [])
+        for item in invalid:
+            if item.path:
+                errors = bulk.drop_errors(errors, item.path)
+            errors.append(item.error)
+            data = bulk.null_field(data, item)
+        return ExecutionResult(data=data, errors=errors)
+
+    def get_bulk_completion(
+        self, result, items, context, document, variables, operation_name
+    ) -> typing.Tuple[typing.Optional[ExecutionContext], typing.List[bulk.BulkItem]]:
+        """
+        Return the written items whose object fields must be completed again, the fields
+        were serialized before the flush generated values like the pk.
+        """
+        items = [item for item in items if bulk.is_completable(item)]
+        if result.data is None or not items:
+            return None, []
+        execution_context = ExecutionContext.build(
             self.schema,
-            query,
-            variable_values=variables,
+            document,
             context_value=context,
+            raw_variable_values=variables,
             operation_name=operation_name,
         )
+        return execution_context, items
+
+    def parse_document(
+        self, query: str
+    ) -> typing.Tuple[typing.Optional[DocumentNode], typing.List[GraphQLError]]:
+        """
+        Parse and validate the query once, the document is shared by routing and execution.
+        """
+        try:
+            document = parse(query)
+        except GraphQLError as error:
+            return None, [error]
+        return document, validate(self.schema, document)
+
+    @staticmethod
+    def set_routing_hint(request, document, operation_name):
+        request.operation_type = routing.get_operation_type(document, operation_name)
+        return routing.set_operation_type(request.operation_type, routing.is_pinned(request))
 
     @staticmethod
     def json_encode(d):
@@ -149,6 +270,8 @@ class GraphQLView(View):
 
 
 class AsyncGraphQLView(GraphQLView):
+    coalescer: Coalescer = None
+
     @classonlymethod
     def as_view(cls, **initkwargs):
         view = super().as_view(**initkwargs)
@@ -185,19 +308,84 @@ class AsyncGraphQLView(GraphQLView):
         if execution_result.errors:
             data['errors'] = [self.format_error(e) for e in execution_result.errors]
         data['data'] = execution_result.data
-        return Response(data)
+        return routing.pin_response(Response(data), getattr(request, 'operation_type', None))
 
     async def execute_graphql_request(
         self, request, query, variables, operation_name
     ) -> ExecutionResult:
         if not query:
             raise UserInputError(_('Must provide query string.'))
-        context = self.context_value or {}
-        context['request'] = request
-        return await graphql(
+        document, errors = self.parse_document(query)
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+        tokens = self.set_routing_hint(request, document, operation_name)
+        try:
+            if self.should_coalesce(request, operation_name):
+                # `request.user` is usually a lazy object loaded from the database.
+                scope = await sync_to_async(self.get_coalesce_scope, thread_sensitive=True)(request)
+                key = self.coalescer.make_key(query, variables, operation_name, scope)
+                return await self.coalescer.run(
+                    key, lambda: self.execute_document(request, document, variables, operation_name)
+                )
+            return await self.execute_document(request, document, variables, operation_name)
+        finally:
+            routing.reset_operation_type(tokens)
+
+    def should_coalesce(self, request, operation_name) -> bool:
+        # A pinned client must read its own writes from the primary, never join
+        # an execution routed to a replica.
+        if not self.coalescer or routing.is_pinned(request):
+            return False
+        return self.coalescer.allow(request.operation_type, operation_name)
+
+    async def execute_document(
+        self, request, document, variables, operation_name
+    ) -> ExecutionResult:
+        context = self.get_context(request)
+        result = execute(
             self.schema,
-            query,
+            document,
             variable_values=variables,
             context_value=context,
             operation_name=operation_name,
         )
+        if inspect.isawaitable(result):
+            result = await result
+        if not context['bulk'].pending:
+            return result
+        try:
+            items = await sync_to_async(context['bulk'].flush, thread_sensitive=True)()
+        except DatabaseError as e:
+            return self.bulk_failed(result, e)
+        result = self.merge_bulk_errors(result, items)
+        execution_context, items = self.get_bulk_completion(
+            result, items, context, document, variables, operation_name
+        )
+        data, errors = result.data, list(result.errors or [])
+        for item in items:
+            info = item.info
+            errors = bulk.drop_errors(errors, item.path)
+            try:
+                value = execution_context.complete_value(
+                    info.return_type, info.field_nodes, info, info.path, item.instance
+                )
+                if inspect.isawaitable(value):
+                    value = await value
+            except GraphQLError as error:
+                errors.append(error)
+                data = bulk.null_field(data, item)
+            else:
+                data = bulk.set_field(data, item.path, value)
+        if not items:
+            return result
+        return ExecutionResult(data=data, errors=(errors + execution_context.errors) or None)
+
+    @staticmethod
+    def get_coalesce_scope(request) -> str:
+        """
+        Return the auth scope key, only requests with the same key share an execution.
+        """
+        auth = getattr(request, 'auth', None)
+        user = getattr(request, 'user', None)
+        scopes = sorted(auth.scopes) if auth else []
+        return json.dumps([getattr(user, 'pk', None), scopes])
@@ -6,5 +6,6 @@ def pytest_configure():
 
     settings.configure(
         DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        INSTALLED_APPS=['tests'],
     )
     django.setup()
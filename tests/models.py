@@ -32,3 +32,9 @@ class Article(models.Model):
     def __str__(self):
         return self.headline
 
+
+class Tag(models.Model):
+    name = models.CharField(max_length=30, unique=True)
+
+    def __str__(self):
+        return self.name
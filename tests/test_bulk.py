@@ -0,0 +1,186 @@
+import asyncio
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from graphql import (
+    GraphQLArgument,
+    GraphQLBoolean,
+    GraphQLField,
+    GraphQLInt,
+    GraphQLList,
+    GraphQLNonNull,
+    GraphQLObjectType,
+    GraphQLSchema,
+    GraphQLString,
+)
+
+from djgql.bulk import BulkItem, BulkWriter, bulk_create, null_field
+from djgql.exceptions import UserInputError
+from djgql.views import AsyncGraphQLView, GraphQLView
+from .models import Tag
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    with connection.schema_editor() as editor:
+        editor.create_model(Tag)
+    yield
+    with connection.schema_editor() as editor:
+        editor.delete_model(Tag)
+
+
+def resolve_add_tag(parent, info, name):
+    info.context['bulk'].create(Tag(name=name), info=info)
+    return True
+
+
+def resolve_import_tags(parent, info, names):
+    return len(bulk_create(Tag, [{'name': name} for name in names]))
+
+
+def resolve_create_tag(parent, info, name):
+    return info.context['bulk'].create(Tag(name=name), info=info).instance
+
+
+TagType = GraphQLObjectType(
+    'Tag', {'id': GraphQLField(GraphQLNonNull(GraphQLInt)), 'name': GraphQLField(GraphQLString)}
+)
+
+schema = GraphQLSchema(
+    query=GraphQLObjectType('Query', {'ok': GraphQLField(GraphQLBoolean)}),
+    mutation=GraphQLObjectType(
+        'Mutation',
+        {
+            'addTag': GraphQLField(
+                GraphQLBoolean, {'name': GraphQLArgument(GraphQLString)}, resolve_add_tag
+            ),
+            'addTagStrict': GraphQLField(
+                GraphQLNonNull(GraphQLBoolean),
+                {'name': GraphQLArgument(GraphQLString)},
+                resolve_add_tag,
+            ),
+            'createTag': GraphQLField(
+                TagType, {'name': GraphQLArgument(GraphQLString)}, resolve_create_tag
+            ),
+            'importTags': GraphQLField(
+                GraphQLInt,
+                {'names': GraphQLArgument(GraphQLList(GraphQLString))},
+                resolve_import_tags,
+            ),
+        },
+    ),
+)
+
+
+def post(query, view=GraphQLView):
+    request = RequestFactory().post(
+        '/graphql/', data=json.dumps({'query': query}), content_type='application/json'
+    )
+    handler = view.as_view(schema=schema)
+    if asyncio.iscoroutinefunction(handler):
+        # Run the flush on this thread, which holds the in-memory database.
+        handler = async_to_sync(handler)
+    response = handler(request)
+    return json.loads(response.content)
+
+
+def test_aliased_mutations_share_one_insert():
+    with CaptureQueriesContext(connection) as queries:
+        data = post('mutation { a: addTag(name: "a") b: addTag(name: "b") c: addTag(name: "c") }')
+    assert data == {'data': {'a': True, 'b': True, 'c': True}}
+    inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT')]
+    assert len(inserts) == 1
+    assert sorted(Tag.objects.values_list('name', flat=True)) == ['a', 'b', 'c']
+
+
+def test_invalid_field_is_nulled():
+    Tag.objects.create(name='taken')
+    data = post('mutation { a: addTag(name: "taken") b: addTag(name: "b") c: addTag(name: "b") }')
+    assert data['data'] == {'a': None, 'b': True, 'c': None}
+    assert [e['path'] for e in data['errors']] == [['a'], ['c']]
+    assert data['errors'][0]['extensions']['code'] == 'USER_INPUT_ERROR'
+    assert 'name' in data['errors'][0]['extensions']['exception']['fields']
+    assert sorted(Tag.objects.values_list('name', flat=True)) == ['b', 'taken']
+
+
+def test_invalid_non_null_field_nulls_data():
+    data = post('mutation { a: addTagStrict(name: "") b: addTag(name: "b") }')
+    assert data['data'] is None
+    assert data['errors'][0]['path'] == ['a']
+
+
+def test_async_view():
+    data = post('mutation { a: addTag(name: "a") b: addTag(name: "a") }', AsyncGraphQLView)
+    assert data['data'] == {'a': True, 'b': None}
+    assert list(Tag.objects.values_list('name', flat=True)) == ['a']
+
+
+def test_bulk_create_reports_every_invalid_item():
+    Tag.objects.create(name='taken')
+    with CaptureQueriesContext(connection) as queries:
+        with pytest.raises(UserInputError) as info:
+            bulk_create(Tag, [{'name': 'a'}, {'name': 'taken'}, {'name': ''}, {'name': 'a'}])
+    errors = info.value.extensions['exception']['errors']
+    assert [e['index'] for e in errors] == [1, 2, 3]
+    assert list(Tag.objects.values_list('name', flat=True)) == ['taken']
+    # uniqueness of the whole batch is checked with a single query
+    assert len(queries.captured_queries) == 1
+
+
+def test_bulk_create_in_resolver():
+    data = post('mutation { importTags(names: ["a", "b"]) }')
+    assert data == {'data': {'importTags': 2}}
+
+    data = post('mutation { importTags(names: ["c", "a"]) }')
+    assert data['data'] == {'importTags': None}
+    assert data['errors'][0]['extensions']['exception']['errors'][0]['index'] == 1
+    assert Tag.objects.count() == 2
+
+
+def test_bulk_update_excludes_itself():
+    tags = [Tag.objects.create(name='a'), Tag.objects.create(name='b')]
+    writer = BulkWriter()
+    for tag in tags:
+        writer.update(tag, ['name'])
+    assert [item.error for item in writer.flush()] == [None, None]
+
+    tags[1].name = 'a'
+    item = writer.update(tags[1], ['name'])
+    assert writer.flush() == [item] and item.error
+    assert not writer.pending
+    assert Tag.objects.get(pk=tags[1].pk).name == 'b'
+
+
+def test_null_field_copies_data():
+    item = BulkItem(Tag())
+    item.path, item.nullable = ['a', 'b'], True
+    data = {'a': {'b': 1, 'c': 2}}
+    assert null_field(data, item) == {'a': {'b': None, 'c': 2}}
+    assert data == {'a': {'b': 1, 'c': 2}}
+    assert null_field({'a': None}, item) == {'a': None}
+    item.nullable = False
+    assert null_field(data, item) is None
+
+
+@pytest.mark.parametrize('view', [GraphQLView, AsyncGraphQLView])
+def test_returned_instance_is_completed_after_flush(view):
+    data = post(
+        'mutation { a: createTag(name: "a") { id name } b: createTag(name: "a") { id } }', view
+    )
+    tag = Tag.objects.get()
+    assert data['data'] == {'a': {'id': tag.pk, 'name': 'a'}, 'b': None}
+    assert [e['path'] for e in data['errors']] == [['b']]
+
+
+def test_bulk_create_large_batch():
+    inputs = [{'name': 'n%d' % i} for i in range(1500)]
+    assert len(bulk_create(Tag, inputs)) == 1500
+    assert Tag.objects.count() == 1500
+
+    with pytest.raises(UserInputError) as info:
+        bulk_create(Tag, inputs[:1200])
+    assert len(info.value.extensions['exception']['errors']) == 1200
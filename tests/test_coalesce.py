@@ -0,0 +1,188 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.utils.functional import SimpleLazyObject
+from graphql import GraphQLArgument, GraphQLField, GraphQLInt, GraphQLObjectType, GraphQLSchema
+
+from djgql import routing
+from djgql.coalesce import Coalescer
+from djgql.views import AsyncGraphQLView
+from .models import Tag
+
+calls = []
+
+
+async def resolve_echo(parent, info, value=None):
+    calls.append(value)
+    await asyncio.sleep(0.01)
+    return value
+
+
+schema = GraphQLSchema(
+    query=GraphQLObjectType(
+        'Query',
+        {'echo': GraphQLField(GraphQLInt, {'value': GraphQLArgument(GraphQLInt)}, resolve_echo)},
+    ),
+    mutation=GraphQLObjectType(
+        'Mutation',
+        {'echo': GraphQLField(GraphQLInt, {'value': GraphQLArgument(GraphQLInt)}, resolve_echo)},
+    ),
+)
+
+
+def make_request(user=None, cookies=None):
+    factory = RequestFactory()
+    for key, value in (cookies or {}).items():
+        factory.cookies[key] = value
+    request = factory.post('/graphql/', content_type='application/json')
+    if user is not None:
+        request.user = user
+    return request
+
+
+def run_all(view, *operations):
+    async def main():
+        return await asyncio.gather(
+            *(view.execute_graphql_request(*operation) for operation in operations)
+        )
+
+    calls.clear()
+    return asyncio.run(main())
+
+
+def make_view(**kwargs):
+    return AsyncGraphQLView(schema=schema, coalescer=Coalescer(**kwargs))
+
+
+def test_identical_queries_execute_once():
+    view = make_view()
+    query = 'query Echo($v: Int) { echo(value: $v) }'
+    results = run_all(view, *[(make_request(), query, {'v': 1}, 'Echo')] * 5)
+    assert [r.data for r in results] == [{'echo': 1}] * 5
+    assert calls == [1]
+    assert view.coalescer.stats == {'executions': 1, 'saved': 4}
+
+
+def test_mutations_are_not_coalesced():
+    view = make_view()
+    run_all(view, *[(make_request(), 'mutation { echo(value: 1) }', None, None)] * 3)
+    assert calls == [1, 1, 1]
+    assert view.coalescer.stats == {'executions': 0, 'saved': 0}
+
+
+def test_allow_list():
+    view = make_view(operations=['Allowed'])
+    run_all(
+        view,
+        *[(make_request(), 'query Other { echo(value: 1) }', None, 'Other')] * 2,
+        *[(make_request(), 'query Allowed { echo(value: 2) }', None, 'Allowed')] * 2,
+    )
+    assert sorted(calls) == [1, 1, 2]
+
+
+def test_different_variables_or_scopes_are_not_shared():
+    view = make_view()
+    query = 'query Echo($v: Int) { echo(value: $v) }'
+    run_all(
+        view,
+        (make_request(), query, {'v': 1}, 'Echo'),
+        (make_request(), query, {'v': 2}, 'Echo'),
+        (make_request(SimpleNamespace(pk=1)), query, {'v': 3}, 'Echo'),
+        (make_request(SimpleNamespace(pk=2)), query, {'v': 3}, 'Echo'),
+    )
+    assert sorted(calls) == [1, 2, 3, 3]
+
+
+@override_settings(GRAPHQL_STICKY_SECONDS=3)
+def test_pinned_requests_are_not_coalesced():
+    view = make_view()
+    cookies = {routing.STICKY_COOKIE_NAME: '1'}
+    run_all(view, *[(make_request(cookies=cookies), '{ echo(value: 1) }', None, None)] * 2)
+    assert calls == [1, 1]
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    coalescer = Coalescer()
+
+    async def execute():
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def main():
+        leader = asyncio.ensure_future(coalescer.run('key', execute))
+        follower = asyncio.ensure_future(coalescer.run('key', execute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == 'result'
+    assert coalescer.stats == {'executions': 1, 'saved': 1}
+
+
+def test_exception_reaches_every_waiter():
+    coalescer = Coalescer()
+
+    async def execute():
+        await asyncio.sleep(0.01)
+        raise ValueError('boom')
+
+    async def main():
+        return await asyncio.gather(
+            *(coalescer.run('key', execute) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [ValueError] * 3
+    assert coalescer.stats == {'executions': 1, 'saved': 2}
+
+
+def test_separate_event_loops():
+    coalescer = Coalescer()
+
+    async def execute():
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    assert asyncio.run(coalescer.run('key', execute)) == 'result'
+    assert asyncio.run(coalescer.run('key', execute)) == 'result'
+    assert coalescer.stats == {'executions': 2, 'saved': 0}
+
+
+def test_make_key():
+    assert Coalescer.make_key('{ a }', {'x': 1, 'y': 2}, None, '') == Coalescer.make_key(
+        '{ a }', {'y': 2, 'x': 1}, None, ''
+    )
+    assert json.loads(Coalescer.make_key('{ a }', None, 'A', 's'))[2:] == ['A', 's']
+
+
+def test_lazy_database_user():
+    with connection.schema_editor() as editor:
+        editor.create_model(Tag)
+    try:
+        user = Tag.objects.create(name='user')
+        view = make_view()
+        requests = [make_request(SimpleLazyObject(lambda: Tag.objects.get(pk=user.pk)))] * 2
+
+        async def main():
+            return await asyncio.gather(
+                *(
+                    view.execute_graphql_request(r, '{ echo(value: 1) }', None, None)
+                    for r in requests
+                )
+            )
+
+        calls.clear()
+        # Like an ASGI server, run sync code on this thread, which holds the in-memory database.
+        results = async_to_sync(main)()
+        assert [r.data for r in results] == [{'echo': 1}] * 2
+        assert view.coalescer.stats == {'executions': 1, 'saved': 1}
+    finally:
+        with connection.schema_editor() as editor:
+            editor.delete_model(Tag)
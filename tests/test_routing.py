@@ -0,0 +1,156 @@
+import json
+import math
+
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from graphql import GraphQLField, GraphQLObjectType, GraphQLSchema, GraphQLString
+
+from djgql import routing
+from djgql.views import GraphQLView
+
+seen = []
+
+
+def resolve_hint(parent, info):
+    seen.append((routing.current_operation_type(), routing._pinned.get()))
+    return 'ok'
+
+
+schema = GraphQLSchema(
+    query=GraphQLObjectType('Query', {'hint': GraphQLField(GraphQLString, resolve=resolve_hint)}),
+    mutation=GraphQLObjectType(
+        'Mutation', {'touch': GraphQLField(GraphQLString, resolve=resolve_hint)}
+    ),
+)
+
+
+def post(query, cookies=None):
+    factory = RequestFactory()
+    for key, value in (cookies or {}).items():
+        factory.cookies[key] = value
+    request = factory.post(
+        '/graphql/', data=json.dumps({'query': query}), content_type='application/json'
+    )
+    return GraphQLView.as_view(schema=schema)(request)
+
+
+def make_router(**kwargs):
+    options = {'GRAPHQL_REPLICAS': ['replica1', 'replica2'], **kwargs}
+    with override_settings(**options):
+        return routing.OperationRouter()
+
+
+def test_get_operation_type():
+    from graphql import parse
+
+    document = parse('query A { hint } mutation B { touch }')
+    assert routing.get_operation_type(document, 'A') == 'query'
+    assert routing.get_operation_type(document, 'B') == 'mutation'
+    assert routing.get_operation_type(document) is None
+
+
+def test_db_for_read():
+    router = make_router()
+    assert router.db_for_read(None) == 'default'
+
+    tokens = routing.set_operation_type('query')
+    assert router.db_for_read(None) == 'replica1'
+    routing.reset_operation_type(tokens)
+
+    tokens = routing.set_operation_type('mutation')
+    assert router.db_for_read(None) == 'default'
+    routing.reset_operation_type(tokens)
+
+    tokens = routing.set_operation_type('query', pinned=True)
+    assert router.db_for_read(None) == 'default'
+    routing.reset_operation_type(tokens)
+
+
+def test_db_for_write():
+    router = make_router(GRAPHQL_PRIMARY='primary')
+    tokens = routing.set_operation_type('query')
+    assert router.db_for_write(None) == 'primary'
+    routing.reset_operation_type(tokens)
+
+
+def test_round_robin():
+    router = make_router()
+    tokens = routing.set_operation_type('query')
+    assert [router.db_for_read(None) for _ in range(3)] == ['replica1', 'replica2', 'replica1']
+    routing.reset_operation_type(tokens)
+
+
+def test_least_lag():
+    router = make_router(GRAPHQL_REPLICA_STRATEGY='least_lag', GRAPHQL_REPLICA_LAG_QUERY='x')
+    router.get_replica_lag = {'replica1': 5.0, 'replica2': 1.0}.get
+    assert router.get_replica() == 'replica2'
+
+
+def test_least_lag_fallback():
+    router = make_router(GRAPHQL_REPLICA_STRATEGY='least_lag')
+    assert [router.get_replica() for _ in range(2)] == ['replica1', 'replica2']
+
+
+def test_failing_replica_is_skipped():
+    router = make_router(
+        GRAPHQL_REPLICAS=['default', 'missing'],
+        GRAPHQL_REPLICA_STRATEGY='least_lag',
+        GRAPHQL_REPLICA_LAG_QUERY='SELECT 1',
+    )
+    assert router.get_replica() == 'default'
+    assert router.get_replica_lag('missing') == math.inf
+
+
+def test_failing_replica_is_not_queried_again():
+    router = make_router(
+        GRAPHQL_PRIMARY='primary',
+        GRAPHQL_REPLICAS=['default'],
+        GRAPHQL_REPLICA_STRATEGY='least_lag',
+        GRAPHQL_REPLICA_LAG_QUERY='SELECT broken',
+    )
+    tokens = routing.set_operation_type('query')
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            assert router.db_for_read(None) == 'primary'
+        assert len(queries.captured_queries) == 1
+
+        with CaptureQueriesContext(connection) as queries:
+            assert router.db_for_read(None) == 'primary'
+        assert len(queries.captured_queries) == 0
+    finally:
+        routing.reset_operation_type(tokens)
+
+
+def test_replica_lag_is_cached():
+    router = make_router(GRAPHQL_REPLICA_LAG_QUERY='SELECT 2.5')
+    assert router.get_replica_lag('default') == 2.5
+    router.lag_query = 'SELECT 1'
+    assert router.get_replica_lag('default') == 2.5
+
+
+def test_view_sets_routing_hint():
+    seen.clear()
+    post('{ hint }')
+    post('mutation { touch }')
+    assert seen == [('query', False), ('mutation', False)]
+    assert routing.current_operation_type() is None
+
+
+@override_settings(GRAPHQL_STICKY_SECONDS=3)
+def test_sticky_after_mutation():
+    seen.clear()
+    response = post('{ hint }')
+    assert routing.STICKY_COOKIE_NAME not in response.cookies
+
+    response = post('mutation { touch }')
+    assert response.cookies[routing.STICKY_COOKIE_NAME]['max-age'] == 3
+
+    post('{ hint }', cookies={routing.STICKY_COOKIE_NAME: '1'})
+    assert seen[-1] == ('query', True)
+    assert routing._pinned.get() is False
+
+
+def test_syntax_error():
+    response = post('{ hint')
+    assert json.loads(response.content)['errors'][0]['message'].startswith('Syntax Error')